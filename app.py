@@ -1,207 +1,97 @@
 """
-Conversational IVR - Main Flask Application
+Conversational IVR - Main Quart Application
 A voice-enabled IVR system with Azure Speech Services and ElevenLabs.
 """
 
-from flask import Flask, render_template, request, jsonify, send_file
-from flask_cors import CORS
+from quart import Quart, request
+from quart.json.provider import DefaultJSONProvider
+from quart_cors import cors
+import gzip
+import orjson
 import logging
-import io
 from src.config.config import config
-from src.services.speech_service import SpeechService
-from src.services.intent_service import IntentService
+from src.routes.routes import Routes
+from src.services.services import Services
+
+try:
+    import brotli
+except ImportError:  # Fall back to gzip only
+    brotli = None
+
+# Responses smaller than this are sent uncompressed
+COMPRESS_MIN_SIZE = 500
+COMPRESS_MIMETYPES = {"application/json", "text/html"}
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider that encodes and decodes with orjson."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default), mimetype=self.mimetype
+        )
+
+
+async def compress_response(response):
+    """Compress JSON and HTML responses with brotli or gzip when the client accepts it."""
+    if (
+        response.mimetype not in COMPRESS_MIMETYPES
+        or "Content-Encoding" in response.headers
+        or response.status_code < 200
+        or response.status_code == 204
+    ):
+        return response
+
+    accept_encoding = request.headers.get("Accept-Encoding", "")
+    if brotli is not None and "br" in accept_encoding:
+        encoding = "br"
+    elif "gzip" in accept_encoding:
+        encoding = "gzip"
+    else:
+        return response
+
+    data = await response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    if encoding == "br":
+        data = brotli.compress(data, quality=4)
+    else:
+        data = gzip.compress(data, compresslevel=6)
+    response.set_data(data)
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
 
 
 def create_app():
-    """Application factory pattern for creating Flask app."""
+    """Application factory pattern for creating Quart app."""
 
-    # Create Flask app
-    app = Flask(__name__)
-    CORS(app)
+    # Create Quart app
+    app = Quart(__name__)
+    app = cors(app)
+    app.json = OrjsonProvider(app)
+    app.after_request(compress_response)
 
-    # Configure Flask app
+    # Configure Quart app
     app.config["SECRET_KEY"] = config.SECRET_KEY
 
     # Setup logging
     logging.basicConfig(level=logging.INFO)
     logging.info("Starting Conversational IVR application")
 
-    # Initialize services
-    speech_service = SpeechService(config)
-    intent_service = IntentService(config)
-
-    # In-memory session stores
-    conversation_sessions = {}
-    live_transcripts = {}
-
-    # ------------------ Routes ------------------
-    @app.route("/")
-    def index():
-        return render_template("ivr.html")
-
-    # Chunked streaming endpoints
-    @app.route("/api/stream/start", methods=["POST"])
-    def stream_start():
-        try:
-            data = request.get_json(silent=True) or {}
-            session_id = data.get("session_id", "default")
-            live_transcripts[session_id] = ""
-            return jsonify({"success": True, "session_id": session_id})
-        except Exception as e:
-            logging.error(f"Error in stream_start: {e}")
-            return jsonify({"error": str(e)}), 500
-
-    @app.route("/api/stream/chunk", methods=["POST"])
-    def stream_chunk():
-        try:
-            session_id = request.form.get("session_id", "default")
-            if "audio" not in request.files:
-                return jsonify({"error": "No audio file provided"}), 400
-
-            audio_file = request.files["audio"]
-            audio_data = audio_file.read()
-
-            # Save chunk to disk for debugging
-            import os
-            from datetime import datetime
-            base_dir = getattr(config, "STREAM_UPLOADS_DIR", "stream_uploads")
-            session_dir = os.path.join(base_dir, session_id)
-            os.makedirs(session_dir, exist_ok=True)
-            chunk_name = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f") + ".wav"
-            chunk_path = os.path.join(session_dir, chunk_name)
-
-            # Transcribe chunk and accumulate
-            partial_text = (
-                speech_service.transcribe_audio_stream(audio_data, save_path=chunk_path)
-                or ""
-            )
-
-            if session_id not in live_transcripts:
-                live_transcripts[session_id] = ""
-
-            if partial_text:
-                live_transcripts[session_id] = (
-                    live_transcripts[session_id] + " " + partial_text
-                ).strip()
-
-            return jsonify(
-                {
-                    "success": True,
-                    "partial": partial_text,
-                    "transcript": live_transcripts[session_id],
-                    "session_id": session_id,
-                }
-            )
-        except Exception as e:
-            logging.error(f"Error in stream_chunk: {e}")
-            return jsonify({"error": str(e)}), 500
-
-    @app.route("/api/stream/status", methods=["GET"])
-    def stream_status():
-        try:
-            session_id = request.args.get("session_id", "default")
-            transcript = live_transcripts.get(session_id, "")
-            return jsonify(
-                {"success": True, "transcript": transcript, "session_id": session_id}
-            )
-        except Exception as e:
-            logging.error(f"Error in stream_status: {e}")
-            return jsonify({"error": str(e)}), 500
-
-    @app.route("/api/stream/stop", methods=["POST"])
-    def stream_stop():
-        try:
-            data = request.get_json(silent=True) or {}
-            session_id = data.get("session_id", "default")
-            transcript = live_transcripts.get(session_id, "")
-            return jsonify(
-                {"success": True, "transcript": transcript, "session_id": session_id}
-            )
-        except Exception as e:
-            logging.error(f"Error in stream_stop: {e}")
-            return jsonify({"error": str(e)}), 500
-
-    @app.route("/api/transcribe", methods=["POST"])
-    def transcribe_audio():
-        try:
-            if "audio" not in request.files:
-                return jsonify({"error": "No audio file provided"}), 400
-
-            audio_file = request.files["audio"]
-            audio_data = audio_file.read()
-
-            transcript = speech_service.transcribe_audio_stream(audio_data)
-
-            if transcript:
-                return jsonify({"success": True, "transcript": transcript})
-            else:
-                return jsonify({"success": False, "error": "Could not transcribe audio"}), 500
-        except Exception as e:
-            logging.error(f"Error in transcribe_audio: {e}")
-            return jsonify({"error": str(e)}), 500
-
-    @app.route("/api/synthesize", methods=["POST"])
-    def synthesize_speech():
-        try:
-            data = request.get_json()
-            text = data.get("text", "")
-            if not text:
-                return jsonify({"error": "No text provided"}), 400
-
-            audio_data = speech_service.text_to_speech(text)
-            if audio_data:
-                return send_file(io.BytesIO(audio_data), mimetype="audio/mpeg", as_attachment=False)
-            else:
-                return jsonify({"error": "Could not synthesize speech"}), 500
-        except Exception as e:
-            logging.error(f"Error in synthesize_speech: {e}")
-            return jsonify({"error": str(e)}), 500
-
-    @app.route("/api/converse", methods=["POST"])
-    def converse():
-        try:
-            data = request.get_json()
-            user_message = data.get("message", "")
-            session_id = data.get("session_id", "default")
-            if not user_message:
-                return jsonify({"error": "No message provided"}), 400
-
-            if session_id not in conversation_sessions:
-                conversation_sessions[session_id] = []
-            conversation_history = conversation_sessions[session_id]
-
-            intent_result = intent_service.classify_intent(user_message)
-            bot_response = intent_service.generate_response(
-                user_message, intent_result["intent"], conversation_history
-            )
-
-            conversation_history.append({"role": "user", "content": user_message})
-            conversation_history.append({"role": "assistant", "content": bot_response})
-
-            return jsonify(
-                {
-                    "success": True,
-                    "intent": intent_result["intent"],
-                    "confidence": intent_result["confidence"],
-                    "reasoning": intent_result.get("reasoning", ""),
-                    "response": bot_response,
-                }
-            )
-        except Exception as e:
-            logging.error(f"Error in converse: {e}")
-            return jsonify({"error": str(e)}), 500
-
-    @app.route("/api/clear-session", methods=["POST"])
-    def clear_session():
-        try:
-            data = request.get_json()
-            session_id = data.get("session_id", "default")
-            if session_id in conversation_sessions:
-                del conversation_sessions[session_id]
-            return jsonify({"success": True, "message": "Session cleared"})
-        except Exception as e:
-            logging.error(f"Error in clear_session: {e}")
-            return jsonify({"error": str(e)}), 500
+    # Services are constructed on first use
+    services = Services(config)
+
+    # Register routes
+    Routes(app, config, services)
 
     # Log configuration status
     if config.is_configured():
@@ -217,7 +107,7 @@ def main():
     app = create_app()
 
     try:
-        logging.info("🚀 Starting Flask development server...")
+        logging.info("🚀 Starting Quart development server (use hypercorn in production)...")
         app.run(debug=True, use_reloader=False, host="0.0.0.0", port=5002)
     except Exception as e:
         logging.error(f"❌ Failed to start server: {e}")
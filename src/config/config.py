@@ -4,42 +4,87 @@ Handles all configuration settings, API keys, and environment variables.
 """
 
 import os
+from dataclasses import dataclass
+from typing import Optional
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
 
+def _env_flag(value: str) -> bool:
+    """Parse a boolean environment variable such as "1", "true" or "yes"."""
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Settings that may be overridden by environment variables, with their types
+ENV_SETTINGS = {
+    "SECRET_KEY": str,
+    "STREAM_DEBUG_DUMPS": _env_flag,
+    "STREAM_UPLOADS_DIR": str,
+    "SILENCE_RMS_THRESHOLD": float,
+    "SESSION_TTL": int,
+    "SESSION_MAX": int,
+    "TTS_DISK_CACHE_DIR": str,
+    "TTS_DISK_CACHE_TTL": int,
+    "AZURE_MAX_CONCURRENCY": int,
+}
+
+
+@dataclass(frozen=True, slots=True)
 class Config:
-    """Application configuration class."""
+    """Application configuration, immutable once loaded."""
+
+    # App Configuration
+    SECRET_KEY: str = "dev-secret-key-change-in-production"
+    # Save every streamed chunk under STREAM_UPLOADS_DIR for debugging
+    STREAM_DEBUG_DUMPS: bool = False
+    STREAM_UPLOADS_DIR: str = "stream_uploads"
+    # Chunks quieter than this RMS (16-bit sample units) skip one-shot transcription
+    SILENCE_RMS_THRESHOLD: float = 200.0
 
-    # Flask Configuration
-    SECRET_KEY = os.environ.get("SECRET_KEY", "dev-secret-key-change-in-production")
-    STREAM_UPLOADS_DIR = os.environ.get("STREAM_UPLOADS_DIR", "stream_uploads")
+    # Session Store Configuration
+    SESSION_TTL: int = 1800
+    SESSION_MAX: int = 10000
+
+    # Text-to-Speech Cache Configuration (disk tier is off unless a directory is set)
+    TTS_DISK_CACHE_DIR: Optional[str] = None
+    TTS_DISK_CACHE_TTL: int = 7 * 24 * 3600
 
     # Azure Speech Configuration
-    AZURE_SPEECH_KEY = None
-    AZURE_SPEECH_REGION = None
+    AZURE_SPEECH_KEY: Optional[str] = None
+    AZURE_SPEECH_REGION: Optional[str] = None
+    # Concurrent recognition requests allowed by the Speech subscription
+    AZURE_MAX_CONCURRENCY: int = 100
 
     # ElevenLabs Configuration
-    ELEVENLABS_API_KEY = None
+    ELEVENLABS_API_KEY: Optional[str] = None
 
     # OpenAI Configuration (for intent classification)
-    AZURE_OPENAI_API_KEY = None
-    AZURE_OPENAI_ENDPOINT = None
-    AZURE_OPENAI_API_VERSION = None
-
-    def __init__(self):
-        """Initialize configuration by loading API keys."""
-        self._load_api_keys()
-        self._validate_config()
-        # Ensure stream uploads directory exists
-        try:
-            os.makedirs(self.STREAM_UPLOADS_DIR, exist_ok=True)
-        except Exception:
-            pass
-
-    def _load_api_keys(self):
+    AZURE_OPENAI_API_KEY: Optional[str] = None
+    AZURE_OPENAI_ENDPOINT: Optional[str] = None
+    AZURE_OPENAI_API_VERSION: Optional[str] = None
+
+    @classmethod
+    def from_env(cls) -> "Config":
+        """Build configuration from environment variables and keys.py."""
+        settings = {
+            name: cast(os.environ[name])
+            for name, cast in ENV_SETTINGS.items()
+            if name in os.environ
+        }
+        config = cls(**settings, **cls._load_api_keys())
+        config._validate_config()
+        # Ensure stream uploads directory exists when chunks are dumped there
+        if config.STREAM_DEBUG_DUMPS:
+            try:
+                os.makedirs(config.STREAM_UPLOADS_DIR, exist_ok=True)
+            except Exception:
+                pass
+        return config
+
+    @staticmethod
+    def _load_api_keys() -> dict:
         """Load API keys from keys.py or environment variables."""
         try:
             from keys import (
@@ -51,22 +96,26 @@ class Config:
                 AZURE_OPENAI_API_VERSION,
             )
 
-            self.AZURE_SPEECH_KEY = AZURE_SPEECH_KEY
-            self.AZURE_SPEECH_REGION = AZURE_SPEECH_REGION
-            self.ELEVENLABS_API_KEY = ELEVENLABS_API_KEY
-            self.AZURE_OPENAI_API_KEY = AZURE_OPENAI_API_KEY
-            self.AZURE_OPENAI_ENDPOINT = AZURE_OPENAI_ENDPOINT
-            self.AZURE_OPENAI_API_VERSION = AZURE_OPENAI_API_VERSION
+            return {
+                "AZURE_SPEECH_KEY": AZURE_SPEECH_KEY,
+                "AZURE_SPEECH_REGION": AZURE_SPEECH_REGION,
+                "ELEVENLABS_API_KEY": ELEVENLABS_API_KEY,
+                "AZURE_OPENAI_API_KEY": AZURE_OPENAI_API_KEY,
+                "AZURE_OPENAI_ENDPOINT": AZURE_OPENAI_ENDPOINT,
+                "AZURE_OPENAI_API_VERSION": AZURE_OPENAI_API_VERSION,
+            }
         except ImportError:
             # Fallback to environment variables
-            self.AZURE_SPEECH_KEY = os.environ.get("AZURE_SPEECH_KEY")
-            self.AZURE_SPEECH_REGION = os.environ.get("AZURE_SPEECH_REGION")
-            self.ELEVENLABS_API_KEY = os.environ.get("ELEVENLABS_API_KEY")
-            self.AZURE_OPENAI_API_KEY = os.environ.get("AZURE_OPENAI_API_KEY")
-            self.AZURE_OPENAI_ENDPOINT = os.environ.get("AZURE_OPENAI_ENDPOINT")
-            self.AZURE_OPENAI_API_VERSION = os.environ.get(
-                "AZURE_OPENAI_API_VERSION", "2024-12-01-preview"
-            )
+            return {
+                "AZURE_SPEECH_KEY": os.environ.get("AZURE_SPEECH_KEY"),
+                "AZURE_SPEECH_REGION": os.environ.get("AZURE_SPEECH_REGION"),
+                "ELEVENLABS_API_KEY": os.environ.get("ELEVENLABS_API_KEY"),
+                "AZURE_OPENAI_API_KEY": os.environ.get("AZURE_OPENAI_API_KEY"),
+                "AZURE_OPENAI_ENDPOINT": os.environ.get("AZURE_OPENAI_ENDPOINT"),
+                "AZURE_OPENAI_API_VERSION": os.environ.get(
+                    "AZURE_OPENAI_API_VERSION", "2024-12-01-preview"
+                ),
+            }
 
     def _validate_config(self):
         """Validate configuration and show warnings if needed."""
@@ -108,4 +157,4 @@ class Config:
 
 
 # Global configuration instance
-config = Config()
+config = Config.from_env()
@@ -0,0 +1 @@
+"""Routes package for Conversational IVR."""
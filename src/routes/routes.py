@@ -0,0 +1,304 @@
+"""
+HTTP routes for the Conversational IVR application.
+"""
+
+import itertools
+import logging
+import os
+from quart import Response, render_template, request, jsonify
+from quart.utils import run_sync
+from cachetools import TTLCache
+from src.config.config import config
+from src.utils import (
+    PCM_SAMPLE_RATE,
+    BackgroundFileWriter,
+    BufferPool,
+    _make_wav_header,
+    convert_to_pcm16k,
+    get_wav_sample_rate,
+    is_silent,
+    read_into_buffer,
+    strip_wav_header,
+)
+
+logger = logging.getLogger(__name__)
+
+# In-memory session stores; idle sessions expire after SESSION_TTL seconds
+conversation_sessions = TTLCache(maxsize=config.SESSION_MAX, ttl=config.SESSION_TTL)
+live_transcripts = TTLCache(maxsize=config.SESSION_MAX, ttl=config.SESSION_TTL)
+session_dirs = TTLCache(maxsize=config.SESSION_MAX, ttl=config.SESSION_TTL)
+chunk_counters = TTLCache(maxsize=config.SESSION_MAX, ttl=config.SESSION_TTL)
+# Sessions whose stream was stopped; late chunks for them are rejected
+stopped_sessions = TTLCache(maxsize=config.SESSION_MAX, ttl=config.SESSION_TTL)
+
+
+class Routes:
+    """Registers the IVR page and API endpoints on a Quart app."""
+
+    def __init__(self, app, config, services):
+        """Initialize routes and register them on the app."""
+        self.app = app
+        self.config = config
+        self.services = services
+
+        # Debug chunk dumps are written off the request path
+        self.debug_writer = BackgroundFileWriter()
+
+        # Reusable buffers for reading streamed audio chunks
+        self.audio_buffers = BufferPool()
+
+        self._register_routes()
+
+    def _register_routes(self):
+        """Register lifecycle hooks and URL rules."""
+        app = self.app
+        app.after_serving(self.close_http_client)
+
+        app.add_url_rule("/", view_func=self.index)
+
+        # Chunked streaming endpoints
+        app.add_url_rule("/api/stream/start", view_func=self.stream_start, methods=["POST"])
+        app.add_url_rule("/api/stream/chunk", view_func=self.stream_chunk, methods=["POST"])
+        app.add_url_rule("/api/stream/status", view_func=self.stream_status, methods=["GET"])
+        app.add_url_rule("/api/stream/stop", view_func=self.stream_stop, methods=["POST"])
+
+        app.add_url_rule("/api/transcribe", view_func=self.transcribe_audio, methods=["POST"])
+        app.add_url_rule("/api/synthesize", view_func=self.synthesize_speech, methods=["POST"])
+        app.add_url_rule("/api/converse", view_func=self.converse, methods=["POST"])
+        app.add_url_rule("/api/clear-session", view_func=self.clear_session, methods=["POST"])
+
+    async def close_http_client(self):
+        # Services are built on first use; only close the ones that exist
+        if self.services.is_loaded("speech"):
+            await self.services.speech.close()
+        if self.services.is_loaded("intent"):
+            await self.services.intent.close()
+
+    async def index(self):
+        return await render_template("ivr.html")
+
+    async def stream_start(self):
+        try:
+            data = await request.get_json(silent=True) or {}
+            session_id = data.get("session_id", "default")
+            live_transcripts[session_id] = ""
+            stopped_sessions.pop(session_id, None)
+            # Drop any recognizer left over from a previous recording
+            await run_sync(self.services.speech.close_session)(session_id)
+            base_dir = getattr(self.config, "STREAM_UPLOADS_DIR", "stream_uploads")
+            session_dirs[session_id] = os.path.join(base_dir, session_id)
+            # Keep numbering across recordings so earlier chunk dumps are not overwritten
+            if session_id not in chunk_counters:
+                chunk_counters[session_id] = itertools.count()
+            return jsonify({"success": True, "session_id": session_id})
+        except Exception as e:
+            logger.error(f"Error in stream_start: {e}")
+            return jsonify({"error": str(e)}), 500
+
+    async def stream_chunk(self):
+        try:
+            form = await request.form
+            files = await request.files
+            session_id = form.get("session_id", "default")
+            if "audio" not in files:
+                return jsonify({"error": "No audio file provided"}), 400
+
+            if session_id in stopped_sessions:
+                return jsonify({"error": "Stream already stopped"}), 409
+
+            audio_file = files["audio"]
+            buf = self.audio_buffers.acquire()
+            try:
+                audio_data = read_into_buffer(audio_file.stream, buf)
+
+                if self.config.STREAM_DEBUG_DUMPS:
+                    # Queue a copy of the chunk to be saved to disk, since the
+                    # pooled buffer is reused once this request finishes
+                    session_dir = session_dirs.get(session_id)
+                    if session_dir is None:
+                        base_dir = getattr(self.config, "STREAM_UPLOADS_DIR", "stream_uploads")
+                        session_dir = session_dirs[session_id] = os.path.join(
+                            base_dir, session_id
+                        )
+                    counter = chunk_counters.get(session_id)
+                    if counter is None:
+                        counter = chunk_counters[session_id] = itertools.count()
+                    chunk_name = f"{next(counter):06d}.wav"
+                    self.debug_writer.submit(
+                        os.path.join(session_dir, chunk_name), bytes(audio_data)
+                    )
+
+                # Downmix/resample to 16 kHz mono PCM; keep the original rate if that fails
+                pcm = await run_sync(convert_to_pcm16k)(audio_data)
+                if pcm is not None:
+                    sample_rate = PCM_SAMPLE_RATE
+                else:
+                    pcm = strip_wav_header(audio_data)
+                    sample_rate = get_wav_sample_rate(audio_data)
+
+                # The stream may have been stopped while the chunk was converted
+                if session_id in stopped_sessions:
+                    return jsonify({"error": "Stream already stopped"}), 409
+                recognition = await run_sync(
+                    self.services.speech.get_or_create_session
+                )(session_id, sample_rate)
+                if recognition is not None:
+                    # Feed every chunk, silence included: the recognizer needs the
+                    # trailing silence to detect the end of an utterance
+                    recognition.write(bytes(pcm))
+                    partial_text = recognition.pop_recognized()
+                    interim_text = recognition.interim
+                else:
+                    # Fall back to one-shot transcription of the converted chunk,
+                    # skipping the request when the chunk is silent
+                    partial_text = ""
+                    if not is_silent(pcm, self.config.SILENCE_RMS_THRESHOLD):
+                        partial_text = (
+                            await self.services.speech.transcribe_audio_stream_async(
+                                _make_wav_header(len(pcm), sample_rate) + pcm
+                            )
+                            or ""
+                        )
+                    interim_text = ""
+            finally:
+                self.audio_buffers.release(buf)
+
+            transcript = live_transcripts.get(session_id, "")
+            if partial_text:
+                transcript = (transcript + " " + partial_text).strip()
+            live_transcripts[session_id] = transcript
+
+            # Only the new text is returned; the full transcript is at /api/stream/status
+            return jsonify(
+                {
+                    "success": True,
+                    "partial": partial_text,
+                    "interim": interim_text,
+                    "session_id": session_id,
+                }
+            )
+        except Exception as e:
+            logger.error(f"Error in stream_chunk: {e}")
+            return jsonify({"error": str(e)}), 500
+
+    async def stream_status(self):
+        try:
+            session_id = request.args.get("session_id", "default")
+            transcript = live_transcripts.get(session_id, "")
+            return jsonify(
+                {"success": True, "transcript": transcript, "session_id": session_id}
+            )
+        except Exception as e:
+            logger.error(f"Error in stream_status: {e}")
+            return jsonify({"error": str(e)}), 500
+
+    async def stream_stop(self):
+        try:
+            data = await request.get_json(silent=True) or {}
+            session_id = data.get("session_id", "default")
+            stopped_sessions[session_id] = True
+
+            # Stop the recognizer and collect the final results it flushes
+            remaining_text = await run_sync(self.services.speech.close_session)(
+                session_id
+            )
+            transcript = live_transcripts.get(session_id, "")
+            if remaining_text:
+                transcript = (transcript + " " + remaining_text).strip()
+                live_transcripts[session_id] = transcript
+
+            return jsonify(
+                {"success": True, "transcript": transcript, "session_id": session_id}
+            )
+        except Exception as e:
+            logger.error(f"Error in stream_stop: {e}")
+            return jsonify({"error": str(e)}), 500
+
+    async def transcribe_audio(self):
+        try:
+            files = await request.files
+            if "audio" not in files:
+                return jsonify({"error": "No audio file provided"}), 400
+
+            audio_file = files["audio"]
+            audio_data = audio_file.read()
+
+            transcript = await self.services.speech.transcribe_audio_stream_async(
+                audio_data
+            )
+
+            if transcript:
+                return jsonify({"success": True, "transcript": transcript})
+            else:
+                return jsonify({"success": False, "error": "Could not transcribe audio"}), 500
+        except Exception as e:
+            logger.error(f"Error in transcribe_audio: {e}")
+            return jsonify({"error": str(e)}), 500
+
+    async def synthesize_speech(self):
+        try:
+            data = await request.get_json()
+            text = data.get("text", "")
+            if not text:
+                return jsonify({"error": "No text provided"}), 400
+
+            # Pull the first chunk before responding so upstream errors still return 500
+            audio_stream = self.services.speech.text_to_speech_stream(text)
+            try:
+                first_chunk = await audio_stream.__anext__()
+            except StopAsyncIteration:
+                return jsonify({"error": "Could not synthesize speech"}), 500
+
+            async def generate():
+                yield first_chunk
+                async for chunk in audio_stream:
+                    yield chunk
+
+            return Response(generate(), mimetype="audio/mpeg")
+        except Exception as e:
+            logger.error(f"Error in synthesize_speech: {e}")
+            return jsonify({"error": str(e)}), 500
+
+    async def converse(self):
+        try:
+            data = await request.get_json()
+            user_message = data.get("message", "")
+            session_id = data.get("session_id", "default")
+            if not user_message:
+                return jsonify({"error": "No message provided"}), 400
+
+            conversation_history = conversation_sessions.get(session_id, [])
+
+            intent_result = await self.services.intent.classify_and_respond(
+                user_message, conversation_history
+            )
+            bot_response = intent_result["response"]
+
+            conversation_history.append({"role": "user", "content": user_message})
+            conversation_history.append({"role": "assistant", "content": bot_response})
+            self.services.intent.trim_history(conversation_history)
+            # Re-assign so the session's TTL restarts on every turn
+            conversation_sessions[session_id] = conversation_history
+
+            return jsonify(
+                {
+                    "success": True,
+                    "intent": intent_result["intent"],
+                    "confidence": intent_result["confidence"],
+                    "reasoning": intent_result.get("reasoning", ""),
+                    "response": bot_response,
+                }
+            )
+        except Exception as e:
+            logger.error(f"Error in converse: {e}")
+            return jsonify({"error": str(e)}), 500
+
+    async def clear_session(self):
+        try:
+            data = await request.get_json()
+            session_id = data.get("session_id", "default")
+            conversation_sessions.pop(session_id, None)
+            return jsonify({"success": True, "message": "Session cleared"})
+        except Exception as e:
+            logger.error(f"Error in clear_session: {e}")
+            return jsonify({"error": str(e)}), 500
@@ -2,12 +2,102 @@
 Intent service for classifying user messages and generating appropriate responses.
 """
 
+import functools
 import logging
+import threading
+import time
 from typing import Dict, Any
+import httpx
 import openai
+import orjson
+from cachetools import LRUCache
 
 logger = logging.getLogger(__name__)
 
+INTENT_CACHE_SIZE = 4096
+
+# Stored conversation history is trimmed to this many prompt tokens
+HISTORY_TOKEN_BUDGET = 2000
+# Per-message overhead of the chat format (role and separators)
+MESSAGE_TOKEN_OVERHEAD = 4
+# Seconds to wait before retrying a failed tokenizer load
+TOKENIZER_RETRY_INTERVAL = 60.0
+
+# The system prompt is built once at import time and sent as a fixed prefix
+CONVERSE_SYSTEM_PROMPT = """You are a virtual assistant for a voice IVR. For each user message:
+1. Classify it into one of these categories:
+- question: User is asking for information or clarification
+- complaint: User is expressing dissatisfaction or reporting an issue
+- other: General conversation, greeting, or non-specific intent
+2. Reply to the user in a tone that matches the intent:
+- question: Be helpful, clear and concise. If you need more context, ask a follow-up question.
+- complaint: Be empathetic. Acknowledge their concern and offer to help resolve the issue.
+- other: Be friendly and brief. If appropriate, ask how you can help them today.
+Keep the reply short and conversational, suitable for being read aloud.
+
+Respond ONLY with a JSON object containing:
+{
+    "intent": "question|complaint|other",
+    "confidence": <float between 0 and 1>,
+    "reasoning": "brief explanation",
+    "response": "your reply to the user"
+}"""
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+# GPT-4 tokenizer, loaded on a background thread since tiktoken may download
+# its BPE file; token counts are estimated until it is available
+_encoding = None
+_encoding_loading = False
+_encoding_attempted_at = float("-inf")
+_encoding_lock = threading.Lock()
+
+
+def _load_encoding():
+    global _encoding, _encoding_loading
+    try:
+        import tiktoken
+
+        _encoding = tiktoken.encoding_for_model("gpt-4")
+        logger.info("Tokenizer loaded")
+    except Exception as e:
+        logger.warning(f"Tokenizer unavailable, estimating token counts: {e}")
+    finally:
+        _encoding_loading = False
+
+
+def _load_encoding_in_background():
+    """Start loading the tokenizer unless it is loaded, loading, or recently failed."""
+    global _encoding_loading, _encoding_attempted_at
+    with _encoding_lock:
+        now = time.monotonic()
+        if (
+            _encoding is not None
+            or _encoding_loading
+            or now - _encoding_attempted_at < TOKENIZER_RETRY_INTERVAL
+        ):
+            return
+        _encoding_loading = True
+        _encoding_attempted_at = now
+    threading.Thread(target=_load_encoding, name="tokenizer-loader", daemon=True).start()
+
+
+@functools.lru_cache(maxsize=8192)
+def _encoded_length(text: str) -> int:
+    """Token count of text, cached so stored messages are only encoded once."""
+    return len(_encoding.encode(text))
+
+
+def _count_tokens(text: str) -> int:
+    """Count tokens in text, estimating until the tokenizer has loaded."""
+    if _encoding is None:
+        _load_encoding_in_background()
+        return len(text) // 4 + 1
+    return _encoded_length(text)
+
 
 class IntentService:
     """Service for intent classification and conversation management."""
@@ -17,110 +107,102 @@ class IntentService:
         self.config = config
         openai_config = config.get_openai_config()
 
+        # Have the tokenizer ready before the first history trim
+        _load_encoding_in_background()
+
+        # Results for recurring opening messages keyed by normalized text
+        self._opening_cache = LRUCache(maxsize=INTENT_CACHE_SIZE)
+
         if openai_config["api_key"] and openai_config["azure_endpoint"]:
-            # Initialize Azure OpenAI client
-            self.client = openai.AzureOpenAI(
+            # Initialize async Azure OpenAI client on a pooled HTTP/2 connection
+            self.client = openai.AsyncAzureOpenAI(
                 api_key=openai_config["api_key"],
                 api_version=openai_config["api_version"],
                 azure_endpoint=openai_config["azure_endpoint"],
+                http_client=httpx.AsyncClient(
+                    http2=True,
+                    limits=httpx.Limits(
+                        max_connections=200, max_keepalive_connections=100
+                    ),
+                    timeout=httpx.Timeout(30.0, connect=2.0),
+                ),
             )
             logger.info("✅ Intent Service initialized with Azure OpenAI")
         else:
             logger.warning("⚠️ OpenAI not configured")
             self.client = None
 
-    def classify_intent(self, user_message: str) -> Dict[str, Any]:
-        """Classify user intent: question, complaint, or other."""
+    async def close(self):
+        """Close the Azure OpenAI client and its connection pool."""
+        if self.client is not None:
+            await self.client.close()
+
+    async def classify_and_respond(
+        self, user_message: str, conversation_history: list
+    ) -> Dict[str, Any]:
+        """Classify intent and generate the response in a single completion call."""
         if not self.client:
             return {
                 "intent": "other",
                 "confidence": 0.0,
                 "reasoning": "OpenAI not configured",
+                "response": "I'm sorry, but I'm having trouble processing your request right now.",
             }
 
+        # Opening turns (greetings etc.) have no history, so their results can be reused
+        cache_key = _normalize(user_message) if not conversation_history else None
+        if cache_key is not None:
+            cached = self._opening_cache.get(cache_key)
+            if cached is not None:
+                return dict(cached)
+
+        # Build conversation messages; the static system prompt goes first so
+        # repeated requests share a common prefix
+        messages = [{"role": "system", "content": CONVERSE_SYSTEM_PROMPT}]
+
+        # Add conversation history (already trimmed to HISTORY_TOKEN_BUDGET)
+        messages.extend(conversation_history)
+
+        # Add current user message
+        messages.append({"role": "user", "content": user_message})
+
         try:
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model="gpt-4",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """You are an intent classifier. Classify user messages into one of these categories:
-                        - question: User is asking for information or clarification
-                        - complaint: User is expressing dissatisfaction or reporting an issue
-                        - other: General conversation, greeting, or non-specific intent
-                        
-                        Respond ONLY with a JSON object containing:
-                        {
-                            "intent": "question|complaint|other",
-                            "confidence": <float between 0 and 1>,
-                            "reasoning": "brief explanation"
-                        }""",
-                    },
-                    {"role": "user", "content": user_message},
-                ],
-                temperature=0.3,
+                messages=messages,
+                temperature=0.5,
+                max_tokens=300,
                 response_format={"type": "json_object"},
             )
 
-            result = eval(response.choices[0].message.content)
+            result = orjson.loads(response.choices[0].message.content)
+            result["response"] = str(result.get("response", "")).strip()
             logger.info(
-                f"Intent classified: {result['intent']} (confidence: {result['confidence']})"
+                f"Intent classified: {result['intent']} (confidence: {result['confidence']}), "
+                f"response: {result['response'][:100]}..."
             )
+            if cache_key is not None:
+                self._opening_cache[cache_key] = dict(result)
             return result
 
         except Exception as e:
-            logger.error(f"Error classifying intent: {e}")
+            logger.error(f"Error classifying intent and generating response: {e}")
             return {
                 "intent": "other",
                 "confidence": 0.0,
                 "reasoning": f"Error: {str(e)}",
+                "response": "I apologize, but I'm having trouble understanding. Could you please rephrase that?",
             }
 
-    def generate_response(
-        self, user_message: str, intent: str, conversation_history: list
-    ) -> str:
-        """Generate an appropriate response based on intent and conversation history."""
-        if not self.client:
-            return (
-                "I'm sorry, but I'm having trouble processing your request right now."
-            )
-
-        # Define system prompts based on intent
-        system_prompts = {
-            "question": """You are a helpful virtual assistant. The user has asked a question.
-            Provide a clear, concise, and helpful response. If you need more context, ask a follow-up question.
-            Be conversational and natural in your response.""",
-            "complaint": """You are an empathetic customer service assistant. The user has raised a complaint or concern.
-            Acknowledge their concern, show empathy, and offer to help resolve the issue.
-            Be warm, understanding, and professional in your response.""",
-            "other": """You are a friendly and professional virtual assistant.
-            Engage naturally with the user. Keep responses brief and conversational.
-            If appropriate, you can ask how you can help them today.""",
-        }
-
-        system_prompt = system_prompts.get(intent, system_prompts["other"])
-
-        # Build conversation messages
-        messages = [{"role": "system", "content": system_prompt}]
-
-        # Add conversation history (limit to last 6 messages to keep context manageable)
-        for msg in conversation_history[-6:]:
-            messages.append(msg)
-
-        # Add current user message
-        messages.append({"role": "user", "content": user_message})
-
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4", messages=messages, temperature=0.7, max_tokens=150
-            )
-
-            bot_response = response.choices[0].message.content.strip()
-            logger.info(
-                f"Generated response for intent '{intent}': {bot_response[:100]}..."
-            )
-            return bot_response
-
-        except Exception as e:
-            logger.error(f"Error generating response: {e}")
-            return "I apologize, but I'm having trouble understanding. Could you please rephrase that?"
+    def trim_history(
+        self, conversation_history: list, max_tokens: int = HISTORY_TOKEN_BUDGET
+    ) -> list:
+        """Drop the oldest messages in place until the history fits max_tokens."""
+        total = sum(
+            _count_tokens(msg["content"]) + MESSAGE_TOKEN_OVERHEAD
+            for msg in conversation_history
+        )
+        while conversation_history and total > max_tokens:
+            msg = conversation_history.pop(0)
+            total -= _count_tokens(msg["content"]) + MESSAGE_TOKEN_OVERHEAD
+        return conversation_history
@@ -0,0 +1,31 @@
+"""
+Service locator for Conversational IVR.
+Builds each service, and imports its SDKs, on first use.
+"""
+
+from functools import cached_property
+
+
+class Services:
+    """Lazily constructed application services."""
+
+    def __init__(self, config):
+        self.config = config
+
+    @cached_property
+    def speech(self):
+        """Speech service (Azure STT and ElevenLabs TTS)."""
+        from src.services.speech_service import SpeechService
+
+        return SpeechService(self.config)
+
+    @cached_property
+    def intent(self):
+        """Intent service (Azure OpenAI)."""
+        from src.services.intent_service import IntentService
+
+        return IntentService(self.config)
+
+    def is_loaded(self, name: str) -> bool:
+        """Check whether a service has been constructed yet."""
+        return name in self.__dict__
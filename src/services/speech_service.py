@@ -2,14 +2,143 @@
 Speech service for handling speech-to-text and text-to-speech operations.
 """
 
+import asyncio
+import hashlib
 import logging
-import requests
-from typing import Optional
-from azure.cognitiveservices.speech import SpeechConfig, SpeechRecognizer, AudioConfig
-from azure.cognitiveservices.speech.audio import PushAudioInputStream
+import queue
+import threading
+import time
+import httpx
+from typing import AsyncIterator, Dict, Optional, Union
+from cachetools import LRUCache
+from azure.cognitiveservices.speech import (
+    SpeechConfig,
+    SpeechRecognizer,
+    AudioConfig,
+    CancellationReason,
+    ResultReason,
+)
+from azure.cognitiveservices.speech.audio import (
+    AudioStreamContainerFormat,
+    AudioStreamFormat,
+    PushAudioInputStream,
+)
+from src.utils import (
+    PCM_SAMPLE_RATE,
+    _make_wav_header,
+    convert_to_pcm16k,
+    get_wav_sample_rate,
+    is_pcm16k_mono_wav,
+    is_webm,
+    strip_wav_header,
+)
+
+try:
+    import diskcache
+except ImportError:  # Disk tier of the TTS cache is optional
+    diskcache = None
+
+try:
+    import xxhash
+except ImportError:  # Fall back to blake2b cache keys
+    xxhash = None
 
 logger = logging.getLogger(__name__)
 
+AZURE_STT_REST_URL = (
+    "https://{region}.stt.speech.microsoft.com/speech/recognition/"
+    "conversation/cognitiveservices/v1"
+)
+
+TTS_CACHE_SIZE = 512
+
+# Seconds to wait for a session to finish recognizing buffered audio once its stream is closed
+SESSION_STOP_TIMEOUT = 5.0
+TTS_MODEL_ID = "eleven_turbo_v2_5"
+
+# Request body fields shared by every ElevenLabs synthesis call
+_TTS_BASE = {
+    "model_id": TTS_MODEL_ID,
+    "voice_settings": {"stability": 0.5, "similarity_boost": 0.5},
+}
+
+
+class RecognitionSession:
+    """Continuous recognition over a push audio stream for one streaming session.
+
+    Recognizer callbacks run on SDK threads; final results are handed over
+    through a thread-safe queue and the latest interim hypothesis is kept.
+    Once the recognizer is canceled or its session stops, the session is
+    marked dead and must be replaced.
+    """
+
+    def __init__(self, recognizer: SpeechRecognizer, stream: PushAudioInputStream):
+        self.recognizer = recognizer
+        self.stream = stream
+        self.interim = ""
+        self.dead = False
+        self.last_used = time.monotonic()
+        self._recognized = queue.Queue()
+        self._stopped = threading.Event()
+
+        recognizer.recognizing.connect(self._on_recognizing)
+        recognizer.recognized.connect(self._on_recognized)
+        recognizer.canceled.connect(self._on_canceled)
+        recognizer.session_stopped.connect(self._on_session_stopped)
+        recognizer.start_continuous_recognition_async()
+
+    def _on_recognizing(self, evt):
+        self.interim = evt.result.text
+
+    def _on_recognized(self, evt):
+        self.interim = ""
+        if evt.result.reason == ResultReason.RecognizedSpeech and evt.result.text:
+            logger.info(f"Recognized: {evt.result.text}")
+            self._recognized.put(evt.result.text)
+
+    def _on_canceled(self, evt):
+        details = evt.cancellation_details
+        if details.reason == CancellationReason.Error:
+            logger.error(
+                f"Recognition canceled: {details.code} {details.error_details}"
+            )
+        else:
+            logger.info(f"Recognition canceled: {details.reason}")
+        self.dead = True
+        self._stopped.set()
+
+    def _on_session_stopped(self, evt):
+        self.dead = True
+        self._stopped.set()
+
+    def write(self, pcm_data: bytes):
+        """Push raw PCM audio (no header) to the recognizer."""
+        self.last_used = time.monotonic()
+        self.stream.write(pcm_data)
+
+    def pop_recognized(self) -> str:
+        """Return the final results recognized since the last call."""
+        texts = []
+        while True:
+            try:
+                texts.append(self._recognized.get_nowait())
+            except queue.Empty:
+                return " ".join(texts)
+
+    def close(self, wait: bool = True) -> str:
+        """End the audio stream and stop recognition; returns any remaining final text.
+        With wait=True this blocks until the recognizer has worked through the
+        audio still buffered in the stream (up to SESSION_STOP_TIMEOUT seconds)
+        and has flushed its results.
+        """
+        self.stream.close()
+        if wait and not self._stopped.wait(SESSION_STOP_TIMEOUT):
+            logger.warning("Recognition session did not stop in time; stopping it")
+        stopped = self.recognizer.stop_continuous_recognition_async()
+        if wait:
+            stopped.get()
+        return self.pop_recognized()
+
 
 class SpeechService:
     """Service for handling Azure Speech Services and ElevenLabs."""
@@ -19,6 +148,9 @@ class SpeechService:
         self.config = config
         self.azure_speech_config = config.get_azure_speech_config()
         self.elevenlabs_api_key = config.ELEVENLABS_API_KEY
+        self._tts_headers = (
+            {"xi-api-key": self.elevenlabs_api_key} if self.elevenlabs_api_key else {}
+        )
 
         # Initialize Azure Speech Service
         if self.azure_speech_config["api_key"] and self.azure_speech_config["region"]:
@@ -31,6 +163,69 @@ class SpeechService:
             logger.warning("⚠️ Azure Speech Services not configured")
             self.speech_config = None
 
+        # Synthesized audio keyed by hash of voice, model and text; the optional
+        # disk tier keeps prompts across restarts
+        self._tts_cache = LRUCache(maxsize=TTS_CACHE_SIZE)
+        self._tts_disk_cache = None
+        if config.TTS_DISK_CACHE_DIR:
+            if diskcache is not None:
+                self._tts_disk_cache = diskcache.Cache(config.TTS_DISK_CACHE_DIR)
+            else:
+                logger.warning("diskcache not installed; TTS disk cache disabled")
+
+        # Keep-alive HTTP/2 client for blocking ElevenLabs calls, created on first use
+        self._http: Optional[httpx.Client] = None
+        self._http_lock = threading.Lock()
+
+        # Shared async HTTP client, opened when the server starts serving
+        self.http_client: Optional[httpx.AsyncClient] = None
+
+        # Continuous recognition sessions keyed by streaming session id
+        self._sessions: Dict[str, RecognitionSession] = {}
+        self._sessions_lock = threading.Lock()
+
+        # Whether WebM can be handed to the SDK undecoded; cleared if that fails
+        self._compressed_input = True
+
+        # Caps in-flight Azure Speech requests at the subscription's concurrency limit
+        self._azure_semaphore = asyncio.Semaphore(config.AZURE_MAX_CONCURRENCY)
+
+    async def open(self):
+        """Open the shared connection pool used for upstream HTTPS calls."""
+        if self.http_client is None:
+            self.http_client = httpx.AsyncClient(
+                http2=True,
+                timeout=httpx.Timeout(30.0, connect=2.0),
+                limits=httpx.Limits(
+                    max_connections=200,
+                    max_keepalive_connections=100,
+                    keepalive_expiry=60.0,
+                ),
+            )
+
+    async def close(self):
+        """Close the shared connection pools and the TTS disk cache."""
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+        with self._http_lock:
+            http, self._http = self._http, None
+        if http is not None:
+            http.close()
+        if self._tts_disk_cache is not None:
+            self._tts_disk_cache.close()
+
+    def _get_http(self) -> httpx.Client:
+        """Return the blocking ElevenLabs client, creating it on first use."""
+        with self._http_lock:
+            if self._http is None:
+                self._http = httpx.Client(
+                    http2=True,
+                    timeout=httpx.Timeout(30.0, connect=2.0),
+                    headers=self._tts_headers,
+                )
+            return self._http
+
     def create_streaming_recognizer(
         self, audio_stream: PushAudioInputStream
     ) -> Optional[SpeechRecognizer]:
@@ -50,6 +245,126 @@ class SpeechService:
             logger.error(f"Error creating recognizer: {e}")
             return None
 
+    @staticmethod
+    def _tts_cache_key(
+        text: str, voice_id: str, model_id: str = TTS_MODEL_ID
+    ) -> Union[int, bytes]:
+        key = f"{voice_id}|{model_id}|{text}".encode()
+        if xxhash is not None:
+            return xxhash.xxh3_64_intdigest(key)
+        return hashlib.blake2b(key, digest_size=16).digest()
+
+    def _get_cached_speech(self, cache_key: Union[int, bytes]) -> Optional[bytes]:
+        """Look up synthesized audio in memory, then on disk."""
+        audio = self._tts_cache.get(cache_key)
+        if audio is None and self._tts_disk_cache is not None:
+            audio = self._tts_disk_cache.get(cache_key)
+            if audio is not None:
+                self._tts_cache[cache_key] = audio
+        return audio
+
+    async def _get_cached_speech_async(
+        self, cache_key: Union[int, bytes]
+    ) -> Optional[bytes]:
+        """Look up synthesized audio in memory, then on disk off the event loop."""
+        audio = self._tts_cache.get(cache_key)
+        if audio is None and self._tts_disk_cache is not None:
+            audio = await asyncio.to_thread(self._tts_disk_cache.get, cache_key)
+            if audio is not None:
+                self._tts_cache[cache_key] = audio
+        return audio
+
+    def _cache_speech(self, cache_key: Union[int, bytes], audio: bytes):
+        """Store synthesized audio in memory and on disk."""
+        self._tts_cache[cache_key] = audio
+        if self._tts_disk_cache is not None:
+            self._tts_disk_cache.set(
+                cache_key, audio, expire=self.config.TTS_DISK_CACHE_TTL
+            )
+
+    async def _cache_speech_async(self, cache_key: Union[int, bytes], audio: bytes):
+        """Store synthesized audio in memory and on disk off the event loop."""
+        self._tts_cache[cache_key] = audio
+        if self._tts_disk_cache is not None:
+            await asyncio.to_thread(
+                self._tts_disk_cache.set,
+                cache_key,
+                audio,
+                expire=self.config.TTS_DISK_CACHE_TTL,
+            )
+
+    def get_or_create_session(
+        self, session_id: str, sample_rate: int = 16000
+    ) -> Optional[RecognitionSession]:
+        """Get the continuous recognition session for session_id, creating it if needed.
+        The push stream expects 16-bit mono PCM at sample_rate.
+        """
+        if not self.speech_config:
+            logger.error("Azure Speech Services not configured")
+            return None
+
+        with self._sessions_lock:
+            self._close_idle_sessions()
+            session = self._sessions.get(session_id)
+            if session is not None and not session.dead:
+                return session
+
+            # Replace a session whose recognizer was canceled or stopped,
+            # keeping any final text it had not handed over yet
+            pending = ""
+            if session is not None:
+                del self._sessions[session_id]
+                try:
+                    pending = session.close(wait=False)
+                except Exception as e:
+                    logger.error(f"Error closing dead recognition session: {e}")
+                logger.info(f"Recognition session restarted: {session_id}")
+
+            try:
+                stream = PushAudioInputStream(
+                    AudioStreamFormat(
+                        samples_per_second=sample_rate, bits_per_sample=16, channels=1
+                    )
+                )
+                recognizer = self.create_streaming_recognizer(stream)
+                if recognizer is None:
+                    return None
+                session = self._sessions[session_id] = RecognitionSession(
+                    recognizer, stream
+                )
+                if pending:
+                    session._recognized.put(pending)
+                logger.info(f"Recognition session started: {session_id}")
+                return session
+            except Exception as e:
+                logger.error(f"Error creating recognition session: {e}")
+                return None
+
+    def close_session(self, session_id: str) -> str:
+        """Stop the recognition session for session_id and return its remaining final text.
+        Blocks until the recognizer has stopped.
+        """
+        with self._sessions_lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return ""
+        try:
+            return session.close()
+        except Exception as e:
+            logger.error(f"Error closing recognition session: {e}")
+            return ""
+
+    def _close_idle_sessions(self):
+        """Stop sessions that have not received audio within SESSION_TTL seconds."""
+        cutoff = time.monotonic() - self.config.SESSION_TTL
+        for session_id, session in list(self._sessions.items()):
+            if session.last_used < cutoff:
+                del self._sessions[session_id]
+                try:
+                    session.close(wait=False)
+                except Exception as e:
+                    logger.error(f"Error closing idle recognition session: {e}")
+
     def text_to_speech(
         self, text: str, voice_id: str = "21m00Tcm4TlvDq8ikWAM"
     ) -> Optional[bytes]:
@@ -58,85 +373,204 @@ class SpeechService:
             logger.error("ElevenLabs API key not configured")
             return None
 
+        cache_key = self._tts_cache_key(text, voice_id)
+        cached = self._get_cached_speech(cache_key)
+        if cached is not None:
+            logger.info("Text-to-speech cache hit")
+            return cached
+
         try:
             url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
 
-            headers = {"xi-api-key": self.elevenlabs_api_key}
-
-            data = {
-                "text": text,
-                "model_id": "eleven_turbo_v2_5",
-                "voice_settings": {"stability": 0.5, "similarity_boost": 0.5},
-            }
+            data = {**_TTS_BASE, "text": text}
 
-            response = requests.post(url, json=data, headers=headers, timeout=30)
+            response = self._get_http().post(url, json=data)
 
             if response.status_code == 200:
                 logger.info("Text-to-speech conversion successful")
+                self._cache_speech(cache_key, response.content)
                 return response.content
             else:
-                logger.error(
-                    f"ElevenLabs API error: {response.status_code} - {response.text}"
-                )
+                logger.error("ElevenLabs API error: %s", response.status_code)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("ElevenLabs error body: %s", response.text)
                 return None
 
         except Exception as e:
             logger.error(f"Error in text-to-speech conversion: {e}")
             return None
 
-    def transcribe_audio_stream(
-        self, audio_data: bytes, save_path: Optional[str] = None
+    async def text_to_speech_stream(
+        self, text: str, voice_id: str = "21m00Tcm4TlvDq8ikWAM"
+    ) -> AsyncIterator[bytes]:
+        """Stream text-to-speech audio from ElevenLabs as mpeg chunks arrive."""
+        if not self.elevenlabs_api_key:
+            logger.error("ElevenLabs API key not configured")
+            return
+
+        cache_key = self._tts_cache_key(text, voice_id)
+        cached = await self._get_cached_speech_async(cache_key)
+        if cached is not None:
+            logger.info("Text-to-speech cache hit")
+            yield cached
+            return
+
+        if self.http_client is None:
+            await self.open()
+
+        try:
+            url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}/stream"
+
+            data = {**_TTS_BASE, "text": text}
+
+            async with self.http_client.stream(
+                "POST", url, json=data, headers=self._tts_headers
+            ) as response:
+                if response.status_code != 200:
+                    logger.error("ElevenLabs API error: %s", response.status_code)
+                    if logger.isEnabledFor(logging.DEBUG):
+                        await response.aread()
+                        logger.debug("ElevenLabs error body: %s", response.text)
+                    return
+
+                chunks = []
+                async for chunk in response.aiter_bytes(4096):
+                    chunks.append(chunk)
+                    yield chunk
+                logger.info("Text-to-speech streaming successful")
+                await self._cache_speech_async(cache_key, b"".join(chunks))
+
+        except Exception as e:
+            logger.error(f"Error in text-to-speech streaming: {e}")
+
+    async def transcribe_audio_stream_async(
+        self, audio_data: Union[bytes, memoryview]
     ) -> Optional[str]:
-        """Transcribe audio data using Azure Speech Services.
-        If save_path is provided, write the WAV bytes there for debugging; otherwise use a temp file.
+        """Transcribe WAV audio data using the Azure Speech REST API.
+        Uses the shared async client so concurrent requests overlap on the event loop.
+        The short-audio endpoint takes 16 kHz mono PCM, so other audio is resampled first.
+        The audio is sent with chunked transfer encoding, so a memoryview over a
+        pooled buffer can be uploaded without copying it to bytes.
         """
         if not self.speech_config:
             logger.error("Azure Speech Services not configured")
             return None
+        if self.http_client is None:
+            await self.open()
 
-        import tempfile
-        import os
+        if not is_pcm16k_mono_wav(audio_data):
+            pcm = await asyncio.to_thread(convert_to_pcm16k, audio_data)
+            if pcm is not None:
+                audio_data = _make_wav_header(len(pcm)) + pcm
 
-        file_path = save_path
-        cleanup = False
         try:
-            if not file_path:
-                # Use temporary file if no save_path provided
-                with tempfile.NamedTemporaryFile(
-                    delete=False, suffix=".wav"
-                ) as tmp_file:
-                    tmp_file.write(audio_data)
-                    file_path = tmp_file.name
-                cleanup = True
+            url = AZURE_STT_REST_URL.format(region=self.azure_speech_config["region"])
+            sample_rate = get_wav_sample_rate(audio_data)
+            headers = {
+                "Ocp-Apim-Subscription-Key": self.azure_speech_config["api_key"],
+                "Content-Type": f"audio/wav; codecs=audio/pcm; samplerate={sample_rate}",
+                "Accept": "application/json",
+            }
+            params = {"language": "en-US", "format": "simple"}
+
+            async def body():
+                yield audio_data
+
+            async with self._azure_semaphore:
+                response = await self.http_client.post(
+                    url, params=params, headers=headers, content=body()
+                )
+
+            if response.status_code != 200:
+                logger.error("Azure Speech API error: %s", response.status_code)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Azure Speech error body: %s", response.text)
+                return None
+
+            result = response.json()
+            status = result.get("RecognitionStatus")
+            if status == "Success":
+                logger.info(f"Recognized: {result.get('DisplayText', '')}")
+                return result.get("DisplayText")
+            elif status in ("NoMatch", "InitialSilenceTimeout"):
+                logger.warning("No speech could be recognized")
+                return None
             else:
+                logger.warning(f"Recognition failed: {status}")
+                return None
+        except Exception as e:
+            logger.error(f"Error in transcription: {e}")
+            return None
+
+    def transcribe_audio_stream(
+        self, audio_data: bytes, save_path: Optional[str] = None
+    ) -> Optional[str]:
+        """Transcribe WAV or WebM/Opus audio data using Azure Speech Services (blocking).
+        WAV samples are pushed straight to a recognizer; WebM is pushed as-is and
+        decoded by the SDK.
+        If save_path is provided, write the audio bytes there for debugging.
+        """
+        if not self.speech_config:
+            logger.error("Azure Speech Services not configured")
+            return None
+
+        try:
+            if save_path:
                 # Persist to the provided path for debugging
-                with open(file_path, "wb") as f:
+                with open(save_path, "wb") as f:
                     f.write(audio_data)
 
-            from azure.cognitiveservices.speech.audio import AudioConfig
+            recognizer = None
+            webm = is_webm(audio_data)
+            if webm and self._compressed_input:
+                # Compressed input needs no conversion; the SDK decodes it (via GStreamer)
+                stream = PushAudioInputStream(
+                    AudioStreamFormat(
+                        compressed_stream_format=AudioStreamContainerFormat.ANY
+                    )
+                )
+                recognizer = self.create_streaming_recognizer(stream)
+                payload = audio_data
+                if recognizer is None:
+                    # Usually GStreamer is missing; convert in-process from now on
+                    self._compressed_input = False
 
-            audio_config = AudioConfig(filename=file_path)
-            recognizer = SpeechRecognizer(
-                speech_config=self.speech_config, audio_config=audio_config
-            )
+            if recognizer is None:
+                if webm:
+                    payload = convert_to_pcm16k(audio_data)
+                    if payload is None:
+                        return None
+                    sample_rate = PCM_SAMPLE_RATE
+                else:
+                    payload = strip_wav_header(audio_data)
+                    sample_rate = get_wav_sample_rate(audio_data)
+                stream = PushAudioInputStream(
+                    AudioStreamFormat(
+                        samples_per_second=sample_rate, bits_per_sample=16, channels=1
+                    )
+                )
+                recognizer = self.create_streaming_recognizer(stream)
+                if recognizer is None:
+                    return None
+
+            stream.write(bytes(payload))
+            stream.close()
 
             result = recognizer.recognize_once()
 
-            if result.reason.name == "ResultReason.RecognizedSpeech":
+            if result.reason == ResultReason.RecognizedSpeech:
                 logger.info(f"Recognized: {result.text}")
                 return result.text
-            elif result.reason.name == "ResultReason.NoMatch":
+            elif result.reason == ResultReason.NoMatch:
                 logger.warning("No speech could be recognized")
                 return None
             else:
                 logger.warning(f"Recognition failed: {result.reason}")
                 return None
-        except Exception as e:
+        except RuntimeError as e:
+            # The Speech SDK reports native errors as RuntimeError
             logger.error(f"Error in transcription: {e}")
             return None
-        finally:
-            if cleanup and file_path and os.path.exists(file_path):
-                try:
-                    os.unlink(file_path)
-                except:
-                    pass
+        except OSError as e:
+            logger.error(f"Error saving audio for transcription: {e}")
+            return None
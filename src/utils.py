@@ -4,85 +4,362 @@ Utility functions for the Conversational IVR application.
 
 import os
 import io
+import functools
+import queue
+import shutil
+import struct
 import subprocess
+import threading
 import logging
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
 
 logger = logging.getLogger(__name__)
 
+# Resolved once so conversions don't probe or search PATH per call
+_FFMPEG_PATH = shutil.which("ffmpeg")
 
-def convert_webm_to_wav(webm_data: bytes, output_path: str = None) -> bytes:
-    """Convert WebM audio data to WAV format using ffmpeg."""
+# Pipe size for ffmpeg stdin/stdout, large enough for a whole chunk
+FFMPEG_PIPE_SIZE = 1 << 20
+
+# Sample rate of the PCM audio sent to Azure Speech
+PCM_SAMPLE_RATE = 16000
+
+# EBML header that starts every WebM/Matroska file
+WEBM_MAGIC = b"\x1a\x45\xdf\xa3"
+
+
+class BackgroundFileWriter:
+    """Write files from a bounded queue on a daemon thread.
+
+    Used for debug dumps so disk I/O never sits on the request path. When the
+    queue is full, new writes are dropped rather than applying backpressure.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._created_dirs = set()
+        self._thread = threading.Thread(
+            target=self._run, name="background-file-writer", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, path: str, data: bytes) -> bool:
+        """Queue data to be written to path. Returns False if the write was dropped."""
+        try:
+            self._queue.put_nowait((path, data))
+            return True
+        except queue.Full:
+            logger.debug(f"Write queue full, dropping {path}")
+            return False
+
+    def _run(self):
+        while True:
+            path, data = self._queue.get()
+            try:
+                directory = os.path.dirname(path)
+                if directory and directory not in self._created_dirs:
+                    os.makedirs(directory, exist_ok=True)
+                    self._created_dirs.add(directory)
+                with open(path, "wb") as f:
+                    f.write(data)
+            except Exception as e:
+                logger.error(f"Error writing {path}: {e}")
+            finally:
+                self._queue.task_done()
+
+
+@functools.lru_cache(maxsize=None)
+def _dump_writer() -> BackgroundFileWriter:
+    """Writer for conversion debug dumps, started on first use."""
+    return BackgroundFileWriter()
+
+
+class BufferPool:
+    """Pool of reusable bytearrays for reading uploaded audio chunks.
+
+    Buffers are handed out with acquire() and must be given back with release()
+    once nothing references them; an empty pool falls back to a fresh buffer.
+    """
+
+    def __init__(self, count: int = 32, size: int = 256 * 1024):
+        self.size = size
+        self._buffers = queue.Queue(maxsize=count)
+        for _ in range(count):
+            self._buffers.put_nowait(bytearray(size))
+
+    def acquire(self) -> bytearray:
+        try:
+            return self._buffers.get_nowait()
+        except queue.Empty:
+            return bytearray(self.size)
+
+    def release(self, buf: bytearray):
+        try:
+            self._buffers.put_nowait(buf)
+        except queue.Full:
+            pass
+
+
+def read_into_buffer(stream, buf: bytearray):
+    """Read a file-like stream into buf, returning a memoryview over the data.
+    Falls back to returning bytes when the stream does not fit in buf.
+    """
+    readinto = getattr(stream, "readinto", None)
+    if readinto is None:
+        return stream.read()
+    n = readinto(buf)
+    if n < len(buf):
+        return memoryview(buf)[:n]
+    return bytes(buf) + stream.read()
+
+
+def strip_wav_header(audio_data):
+    """Return the PCM payload of canonical 44-byte-header WAV data (or the data as-is)."""
+    if audio_data[:4] == b"RIFF":
+        return audio_data[44:]
+    return audio_data
+
+
+def is_silent(audio_data, rms_threshold: float) -> bool:
+    """Check whether 16-bit PCM/WAV audio is below an RMS loudness threshold."""
+    pcm = strip_wav_header(audio_data)
+    count = len(pcm) // 2
+    if count <= 0:
+        return True
+    import numpy as np
+
+    samples = np.frombuffer(pcm, dtype="<i2", count=count).astype(np.float32)
+    power = float(np.dot(samples, samples)) / count
+    return power < rms_threshold * rms_threshold
+
+
+def is_pcm16k_mono_wav(audio_data) -> bool:
+    """Check for a canonical WAV header describing 16 kHz mono 16-bit PCM."""
+    if len(audio_data) < 44 or audio_data[:4] != b"RIFF" or audio_data[8:12] != b"WAVE":
+        return False
+    fmt, channels, sample_rate = struct.unpack_from("<HHI", audio_data, 20)
+    (bits,) = struct.unpack_from("<H", audio_data, 34)
+    return fmt == 1 and channels == 1 and sample_rate == PCM_SAMPLE_RATE and bits == 16
+
+
+def is_webm(audio_data) -> bool:
+    """Check for the EBML magic that starts WebM (MediaRecorder) audio."""
+    return audio_data[:4] == WEBM_MAGIC
+
+
+def _input_format(audio_data):
+    """Demuxer to use for audio_data, or None to let libavformat probe for it."""
+    return "matroska" if is_webm(audio_data) else None
+
+
+def _grow_pipes(process):
+    """Raise the kernel pipe size of a process's stdin/stdout where supported (Linux)."""
+    if fcntl is None or not hasattr(fcntl, "F_SETPIPE_SZ"):
+        return
+    for pipe in (process.stdin, process.stdout):
+        try:
+            fcntl.fcntl(pipe.fileno(), fcntl.F_SETPIPE_SZ, FFMPEG_PIPE_SIZE)
+        except OSError:
+            # Above /proc/sys/fs/pipe-max-size for unprivileged users; keep the default
+            pass
+
+
+def _spawn_ffmpeg(input_args: list) -> subprocess.Popen:
+    """Start ffmpeg decoding stdin to raw 16 kHz mono PCM on stdout."""
+    process = subprocess.Popen(
+        [
+            _FFMPEG_PATH,
+            "-hide_banner",
+            "-nostats",
+            "-loglevel",
+            "error",
+            *input_args,
+            "-i",
+            "pipe:0",  # Input from stdin
+            "-ac",
+            "1",  # Mono channel
+            "-ar",
+            str(PCM_SAMPLE_RATE),  # Sample rate
+            "-f",
+            "s16le",  # Raw PCM 16-bit little-endian
+            "pipe:1",  # Output to stdout
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        bufsize=FFMPEG_PIPE_SIZE,
+    )
+    _grow_pipes(process)
+    return process
+
+
+class FfmpegWorker:
+    """Keeps an ffmpeg process started ahead of time for the next conversion.
+
+    ffmpeg decodes one input per process, so each conversion takes the waiting
+    process and a replacement is started in the background, keeping fork/exec
+    and library loading off the request path.
+    """
+
+    def __init__(self, input_args: list):
+        self.input_args = input_args
+        self._spare: Optional[subprocess.Popen] = None
+        self._refilling = False
+        self._lock = threading.Lock()
+
+    def take(self) -> subprocess.Popen:
+        """Return a started ffmpeg process that is waiting for input."""
+        with self._lock:
+            process, self._spare = self._spare, None
+            # Only one replacement is started at a time
+            refill = not self._refilling
+            self._refilling = True
+        if refill:
+            threading.Thread(target=self._replenish, daemon=True).start()
+        if process is None or process.poll() is not None:
+            process = _spawn_ffmpeg(self.input_args)
+        return process
+
+    def _replenish(self):
+        process = None
+        try:
+            process = _spawn_ffmpeg(self.input_args)
+        except OSError as e:
+            logger.error(f"Error starting ffmpeg: {e}")
+        finally:
+            # Only this thread fills the slot, so it is still empty here
+            with self._lock:
+                self._spare = process
+                self._refilling = False
+
+
+# Warm ffmpeg for WebM input, the format MediaRecorder produces
+_WEBM_WORKER = FfmpegWorker(["-f", "matroska"])
+
+
+@functools.lru_cache(maxsize=None)
+def _load_av():
+    """Import PyAV on first use, since it is slow to load; None if not installed."""
     try:
-        # Check if ffmpeg is available
-        result = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True)
-        if result.returncode != 0:
-            logger.error(
-                "ffmpeg not found. Please install ffmpeg for audio conversion."
-            )
-            return None
+        import av
+    except ImportError:  # Fall back to the ffmpeg command line tool
+        return None
+    return av
 
-        # Use a temporary output path if not provided
-        if output_path is None:
-            import tempfile
 
-            _, output_path = tempfile.mkstemp(suffix=".wav")
-            should_delete = True
-        else:
-            should_delete = False
+def _resample_pcm16k(av, audio_data):
+    """Decode audio in-process with PyAV, yielding 16 kHz mono s16 frames."""
+    resampler = av.AudioResampler(format="s16", layout="mono", rate=PCM_SAMPLE_RATE)
+    with av.open(io.BytesIO(audio_data), format=_input_format(audio_data)) as container:
+        for frame in container.decode(audio=0):
+            yield from resampler.resample(frame)
+    yield from resampler.resample(None)
+
 
+def convert_to_pcm16k(audio_data):
+    """Decode audio to raw 16 kHz mono 16-bit PCM (no header) using PyAV or ffmpeg.
+    WAV input already in that format is returned without conversion; None on failure.
+    """
+    if is_pcm16k_mono_wav(audio_data):
+        return strip_wav_header(audio_data)
+
+    av = _load_av()
+    if av is not None:
         try:
-            # Run ffmpeg to convert WebM to WAV
-            process = subprocess.Popen(
-                [
-                    "ffmpeg",
-                    "-i",
-                    "pipe:0",  # Input from stdin
-                    "-f",
-                    "wav",  # Output format
-                    "-acodec",
-                    "pcm_s16le",  # PCM 16-bit little-endian
-                    "-ar",
-                    "16000",  # Sample rate
-                    "-ac",
-                    "1",  # Mono channel
-                    output_path,
-                ],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
+            return b"".join(
+                frame.to_ndarray().tobytes()
+                for frame in _resample_pcm16k(av, audio_data)
             )
+        except Exception as e:
+            logger.error(f"Error converting audio to PCM: {e}")
+            return None
 
-            stdout, stderr = process.communicate(input=webm_data)
+    if _FFMPEG_PATH is None:
+        logger.error("ffmpeg not found. Please install ffmpeg for audio conversion.")
+        return None
 
-            if process.returncode != 0:
-                logger.error(f"ffmpeg conversion failed: {stderr.decode()}")
-                return None
+    try:
+        if is_webm(audio_data):
+            process = _WEBM_WORKER.take()
+        else:
+            process = _spawn_ffmpeg([])
 
-            # Read the converted file
-            with open(output_path, "rb") as f:
-                wav_data = f.read()
+        stdout, _ = process.communicate(input=bytes(audio_data))
 
-            return wav_data
+        if process.returncode != 0:
+            logger.error("ffmpeg returned %d", process.returncode)
+            return None
 
-        finally:
-            if should_delete and os.path.exists(output_path):
-                os.unlink(output_path)
+        return stdout
 
     except FileNotFoundError:
         logger.error("ffmpeg not installed. Please install ffmpeg.")
         return None
     except Exception as e:
-        logger.error(f"Error converting WebM to WAV: {e}")
+        logger.error(f"Error converting audio to PCM: {e}")
         return None
 
 
+def get_wav_sample_rate(audio_data: bytes, default: int = 16000) -> int:
+    """Read the sample rate from a RIFF/WAVE header, falling back to a default."""
+    if len(audio_data) >= 28 and audio_data[:4] == b"RIFF" and audio_data[8:12] == b"WAVE":
+        return struct.unpack_from("<I", audio_data, 24)[0]
+    return default
+
+
+def _make_wav_header(
+    pcm_len: int, sample_rate: int = PCM_SAMPLE_RATE, channels: int = 1, bits: int = 16
+) -> bytes:
+    """Build the 44-byte RIFF/WAVE header for pcm_len bytes of PCM audio."""
+    block_align = channels * bits // 8
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF",
+        36 + pcm_len,
+        b"WAVE",
+        b"fmt ",
+        16,  # fmt chunk size
+        1,  # PCM
+        channels,
+        sample_rate,
+        sample_rate * block_align,  # Byte rate
+        block_align,
+        bits,
+        b"data",
+        pcm_len,
+    )
+
+
+def convert_webm_to_wav(webm_data: bytes, output_path: str = None) -> bytes:
+    """Convert WebM audio data to 16 kHz mono WAV format using PyAV or ffmpeg."""
+    pcm = convert_to_pcm16k(webm_data)
+    if pcm is None:
+        return None
+
+    wav_data = _make_wav_header(len(pcm)) + pcm
+
+    # Optionally keep a copy of the converted audio for debugging, written off-thread
+    if output_path is not None:
+        _dump_writer().submit(output_path, wav_data)
+
+    return wav_data
+
+
 def ensure_wav_format(audio_data: bytes, format: str = "webm") -> bytes:
-    """Ensure audio is in WAV format for Azure Speech Services."""
-    if format.lower() == "wav":
+    """Ensure audio is in WAV format for Azure Speech Services.
+    The data's own header decides; format is only a hint for unrecognised input.
+    """
+    # Already WAV, whatever the caller says
+    if len(audio_data) >= 12 and audio_data[:4] == b"RIFF" and audio_data[8:12] == b"WAVE":
         return audio_data
 
     # Try to convert WebM to WAV
-    if format.lower() in ["webm", "ogg"]:
+    if is_webm(audio_data) or format.lower() in ["webm", "ogg"]:
         wav_data = convert_webm_to_wav(audio_data)
         if wav_data:
             return wav_data